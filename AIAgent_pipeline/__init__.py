@@ -3,4 +3,7 @@ from .nodes.node2_binary_classifier import BinaryClassifierNode
 from .nodes.node3_attack_classifier import MultiClassifierNode
 from .agent_manager import WorkflowManager
 from .mode_map import MODEL_MAP
-from .orchestrator import AsyncNetworkPredictor
\ No newline at end of file
+from .admission import AdmissionController, AdmissionRejected, DeadlineExceeded, make_deadline
+from .feature_stats import FeatureStats
+from .profiler import SamplingProfiler, RequestTrace
+from .orchestrator import AsyncNetworkPredictor, PHASE_NAMES
\ No newline at end of file
@@ -0,0 +1,147 @@
+import time
+import logging
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+class AdmissionRejected(Exception):
+    """
+    Request bị từ chối ngay tại cửa vào vì vượt ngân sách số dòng đang xử lý.
+    Mang theo `status_code` và `retry_after` để endpoint trả về cho client.
+    """
+    def __init__(self, message, status_code=429, retry_after=1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """
+    Hết hạn chót của request trước khi xử lý xong — client coi như đã bỏ cuộc.
+    """
+    pass
+
+
+class InflightTicket:
+    """
+    Theo dõi các dòng của một request đang chạy trên thread pool.
+    Callback của future chạy trên event loop nên không cần lock.
+    """
+    def __init__(self):
+        self.running = set()
+
+    def track(self, future):
+        self.running.add(future)
+        future.add_done_callback(self.running.discard)
+
+
+class AdmissionController:
+    def __init__(self, name, max_inflight_rows, retry_after=1):
+        """
+        Kiểm soát số dòng đang xử lý (in-flight) của một endpoint.
+
+        Args:
+            name (str): Tên endpoint (dùng trong log và thống kê).
+            max_inflight_rows (int): Tổng số dòng tối đa được xử lý đồng thời.
+            retry_after (int): Số giây gợi ý client chờ trước khi gửi lại (header `Retry-After`).
+        """
+        if max_inflight_rows <= 0:
+            raise ValueError("[ADMISSION] max_inflight_rows phải > 0")
+        self.name = name
+        self.max_inflight_rows = max_inflight_rows
+        self.retry_after = retry_after
+        self.inflight_rows = 0
+        self.admitted = 0
+        self.shed = 0
+        self.expired = 0
+        self.completed = 0
+
+    # Tất cả request chạy trên cùng một event loop, các hàm dưới đây không await
+    # nên không cần lock.
+    def try_admit(self, n_rows):
+        """
+        Thử nhận `n_rows` dòng vào ngân sách.
+
+        Raises:
+            AdmissionRejected: 413 nếu request lớn hơn cả ngân sách (gửi lại cũng vô ích),
+                               429 nếu ngân sách hiện đang đầy.
+        """
+        if n_rows > self.max_inflight_rows:
+            self.shed += 1
+            logging.warning(f"[WARN][ADMISSION][{self.name}] Request {n_rows} dòng vượt ngân sách {self.max_inflight_rows}.")
+            raise AdmissionRejected(
+                f"Request có {n_rows} dòng, vượt giới hạn {self.max_inflight_rows} dòng mỗi request",
+                status_code=413,
+                retry_after=self.retry_after,
+            )
+        if self.inflight_rows + n_rows > self.max_inflight_rows:
+            self.shed += 1
+            logging.warning(f"[WARN][ADMISSION][{self.name}] Quá tải ({self.inflight_rows}/{self.max_inflight_rows} dòng) -> từ chối {n_rows} dòng.")
+            raise AdmissionRejected(
+                "Hệ thống đang quá tải, vui lòng thử lại sau",
+                status_code=429,
+                retry_after=self.retry_after,
+            )
+        self.inflight_rows += n_rows
+        self.admitted += 1
+
+    def release(self, n_rows):
+        self.inflight_rows = max(0, self.inflight_rows - n_rows)
+
+    @contextmanager
+    def admit(self, n_rows):
+        """
+        Context manager: nhận request vào ngân sách và luôn trả lại khi xử lý xong
+        (kể cả khi lỗi hoặc hết hạn).
+
+        Yields:
+            InflightTicket: Truyền cho predictor để ghi lại các dòng đang chạy trên thread.
+                Dòng nào vẫn còn chạy khi request kết thúc (hết hạn/huỷ) chỉ được trả lại
+                ngân sách khi thread của nó thực sự xong.
+        """
+        self.try_admit(n_rows)
+        ticket = InflightTicket()
+        try:
+            yield ticket
+            self.completed += 1
+        except DeadlineExceeded:
+            self.expired += 1
+            raise
+        finally:
+            pending = [f for f in ticket.running if not f.done()]
+            self.release(n_rows - len(pending))
+            for future in pending:
+                future.add_done_callback(lambda _: self.release(1))
+
+    def stats(self):
+        """
+        Trả về bộ đếm hiện tại của endpoint.
+        """
+        return {
+            "max_inflight_rows": self.max_inflight_rows,
+            "inflight_rows": self.inflight_rows,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "expired": self.expired,
+            "completed": self.completed,
+        }
+
+
+def make_deadline(timeout_s):
+    """
+    Chuyển timeout (giây) thành mốc hạn chót theo `time.monotonic()`.
+    Trả về None nếu không đặt timeout.
+    """
+    if timeout_s is None or timeout_s <= 0:
+        return None
+    return time.monotonic() + timeout_s
+
+
+def remaining(deadline):
+    """
+    Số giây còn lại tới hạn chót (None nếu không có hạn chót).
+    """
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
@@ -1,3 +1,4 @@
+import time
 import logging
 import networkx as nx
 import matplotlib.pyplot as plt
@@ -34,9 +35,13 @@ class WorkflowManager:
         logging.info(f"Kết nối: {from_node} → {to_node} (cond={condition is not None})")
 
     # ===== 3️⃣ Chạy toàn bộ workflow =====
-    def run(self, data):
+    def run(self, data, trace=None):
         """
         Bắt đầu chạy workflow từ START.
+
+        Args:
+            data: Dữ liệu đầu vào cho node đầu tiên.
+            trace (RequestTrace, optional): Nếu có, ghi thời gian xử lý của từng node.
         """
         logging.info("Bắt đầu workflow từ START.")
         current_node = self.start_node
@@ -61,7 +66,12 @@ class WorkflowManager:
             # Xử lý node hiện tại
             node_obj = self.nodes[current_node]
             logging.info(f"Đang chạy node: {current_node}")
-            current_data = node_obj.process(current_data)
+            if trace is not None:
+                start = time.perf_counter()
+                current_data = node_obj.process(current_data)
+                trace.add(current_node, time.perf_counter() - start)
+            else:
+                current_data = node_obj.process(current_data)
 
             # Tìm node tiếp theo phù hợp điều kiện
             next_node = None
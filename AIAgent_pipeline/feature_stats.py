@@ -0,0 +1,281 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+import numpy as np
+
+# Histogram log-scale dùng làm quantile sketch: bin [0, 1e-3) chứa giá trị 0, sau đó
+# 20 bin mỗi thập phân tới 1e12 (sai số tương đối của quantile ~6%). Giá trị sau khi
+# làm sạch luôn >= 0 nên không cần bin âm.
+BINS_PER_DECADE = 20
+HIST_EDGES = np.concatenate([[0.0], np.logspace(-3, 12, 15 * BINS_PER_DECADE + 1)])
+N_BINS = len(HIST_EDGES)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class _Accumulator:
+    """
+    Thống kê cộng dồn, bộ nhớ cố định theo số đặc trưng.
+    """
+    def __init__(self, n_features, start=None):
+        self.start = start if start is not None else time.time()
+        self.end = None
+        self.rows = 0
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+        self.min = np.full(n_features, np.inf)
+        self.max = np.full(n_features, -np.inf)
+        self.hist = np.zeros((n_features, N_BINS), dtype=np.int64)
+        self.nan = np.zeros(n_features, dtype=np.int64)
+        self.inf = np.zeros(n_features, dtype=np.int64)
+        self.clipped = np.zeros(n_features, dtype=np.int64)
+        self.missing = np.zeros(n_features, dtype=np.int64)
+
+    def update(self, values, nan, inf, clipped, missing):
+        n = values.shape[0]
+        # Gộp mean/variance theo công thức song song của Chan (ổn định số học)
+        batch_mean = values.mean(axis=0)
+        batch_m2 = ((values - batch_mean) ** 2).sum(axis=0)
+        total = self.rows + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += batch_m2 + delta ** 2 * self.rows * n / total
+        self.rows = total
+        np.minimum(self.min, values.min(axis=0), out=self.min)
+        np.maximum(self.max, values.max(axis=0), out=self.max)
+
+        bins = np.clip(np.searchsorted(HIST_EDGES, values, side="right") - 1, 0, N_BINS - 1)
+        cols = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+        np.add.at(self.hist, (cols.ravel(), bins.ravel()), 1)
+
+        self.nan += nan
+        self.inf += inf
+        self.clipped += clipped
+        self.missing += missing
+
+    def merge(self, other):
+        if other.rows == 0:
+            return
+        total = self.rows + other.rows
+        delta = other.mean - self.mean
+        self.mean += delta * other.rows / total
+        self.m2 += other.m2 + delta ** 2 * self.rows * other.rows / total
+        self.rows = total
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.hist += other.hist
+        self.nan += other.nan
+        self.inf += other.inf
+        self.clipped += other.clipped
+        self.missing += other.missing
+        self.start = min(self.start, other.start)
+
+    def quantiles(self, qs=QUANTILES):
+        """
+        Ước lượng quantile từ histogram (trung điểm hình học của bin).
+        Trả về mảng shape (n_features, len(qs)).
+        """
+        cum = np.cumsum(self.hist, axis=1)
+        result = np.zeros((self.hist.shape[0], len(qs)))
+        if self.rows == 0:
+            return result
+        for j, q in enumerate(qs):
+            idx = np.minimum((cum < q * self.rows).sum(axis=1), N_BINS - 1)
+            lo = HIST_EDGES[idx]
+            hi = HIST_EDGES[np.minimum(idx + 1, N_BINS - 1)]
+            result[:, j] = np.where(lo > 0, np.sqrt(lo * hi), 0.0)
+        return result
+
+    def snapshot(self, feature_list):
+        rows = max(self.rows, 1)
+        std = np.sqrt(self.m2 / max(self.rows - 1, 1))
+        quantiles = self.quantiles()
+        features = {}
+        for i, name in enumerate(feature_list):
+            features[name] = {
+                "mean": float(self.mean[i]),
+                "std": float(std[i]),
+                "min": float(self.min[i]) if self.rows else None,
+                "max": float(self.max[i]) if self.rows else None,
+                **{f"p{int(q * 100)}": float(quantiles[i, j]) for j, q in enumerate(QUANTILES)},
+                "nan_rate": float(self.nan[i] / rows),
+                "inf_rate": float(self.inf[i] / rows),
+                "clip_rate": float(self.clipped[i] / rows),
+                "missing_rate": float(self.missing[i] / rows),
+            }
+        return {
+            "window_start": self.start,
+            "window_end": self.end,
+            "rows": int(self.rows),
+            "features": features,
+        }
+
+
+class FeatureStats:
+    def __init__(self, feature_list, window_seconds=60, max_windows=12):
+        """
+        Thống kê luồng (streaming) cho từng đặc trưng trên dữ liệu đi qua InputValidatorNode.
+
+        Giữ một cửa sổ hiện tại, `max_windows` cửa sổ đã đóng gần nhất và tổng cộng dồn,
+        nên bộ nhớ cố định bất kể lưu lượng. Thread-safe vì validator chạy trên thread pool.
+
+        Args:
+            feature_list (list): Danh sách đặc trưng theo đúng thứ tự của validator.
+            window_seconds (float): Độ dài mỗi cửa sổ thống kê (giây).
+            max_windows (int): Số cửa sổ đã đóng được giữ lại.
+        """
+        self.feature_list = list(feature_list)
+        self.window_seconds = window_seconds
+        self._n = len(self.feature_list)
+        self._lock = threading.Lock()
+        self._current = _Accumulator(self._n)
+        self._windows = deque(maxlen=max_windows)
+        self._total = _Accumulator(self._n, start=self._current.start)
+        self._reference = None
+
+    def _rotate(self, now):
+        # Gọi khi đang giữ lock
+        if now - self._current.start < self.window_seconds:
+            return
+        self._current.end = now
+        self._windows.append(self._current)
+        self._current = _Accumulator(self._n, start=now)
+
+    def update(self, values, nan=0, inf=0, clipped=0, missing=0):
+        """
+        Cập nhật thống kê với một batch.
+
+        Args:
+            values (np.ndarray): Dữ liệu đã làm sạch, shape (n_rows, n_features).
+            nan, inf, clipped, missing (np.ndarray | int): Số ô bị thay thế theo từng đặc trưng.
+        """
+        if values.shape[0] == 0:
+            return
+        with self._lock:
+            self._rotate(time.time())
+            self._current.update(values, nan, inf, clipped, missing)
+            self._total.update(values, nan, inf, clipped, missing)
+
+    def snapshot(self, window="current"):
+        """
+        Lấy snapshot thống kê.
+
+        Args:
+            window (str | int): "current" (cửa sổ đang mở), "total" (từ lúc khởi động),
+                hoặc số nguyên k: gộp k cửa sổ đã đóng gần nhất.
+
+        Returns:
+            dict: Thống kê theo từng đặc trưng.
+        """
+        with self._lock:
+            self._rotate(time.time())
+            if window == "current":
+                return self._current.snapshot(self.feature_list)
+            if window == "total":
+                return self._total.snapshot(self.feature_list)
+            k = int(window)
+            if k <= 0:
+                raise ValueError("[STATS] Số cửa sổ phải > 0")
+            windows = list(self._windows)[-k:]
+            if not windows:
+                return _Accumulator(self._n).snapshot(self.feature_list)
+            merged = _Accumulator(self._n, start=windows[0].start)
+            for acc in windows:
+                merged.merge(acc)
+            merged.end = windows[-1].end
+            return merged.snapshot(self.feature_list)
+
+    def set_reference(self, path=None):
+        """
+        Chốt phân phối tham chiếu để đo drift: từ file JSON (do `export_reference` tạo,
+        ví dụ trên dữ liệu huấn luyện) hoặc từ thống kê tổng hiện tại nếu không truyền `path`.
+
+        File không đọc được hoặc không khớp cấu hình histogram chỉ bị ghi log và bỏ qua
+        (hàm này chạy lúc khởi tạo validator, không được làm API dừng khởi động).
+
+        Returns:
+            bool: True nếu đã đặt tham chiếu.
+        """
+        if path:
+            hist = self._load_reference(path)
+            if hist is None:
+                return False
+        else:
+            with self._lock:
+                hist = self._total.hist.copy()
+        self._reference = hist
+        return True
+
+    def _load_reference(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("bins_per_decade") != BINS_PER_DECADE:
+                logging.error(f"[ERROR][STATS] File tham chiếu {path} có bins_per_decade={data.get('bins_per_decade')}, "
+                              f"cần {BINS_PER_DECADE} -> bỏ qua tham chiếu.")
+                return None
+            hist = np.zeros((self._n, N_BINS), dtype=np.int64)
+            for i, name in enumerate(self.feature_list):
+                row = data["hist"].get(name)
+                if row is None:
+                    logging.warning(f"[WARN][STATS] File tham chiếu thiếu đặc trưng '{name}' -> không đo drift cho đặc trưng này.")
+                    continue
+                row = np.asarray(row, dtype=np.int64)
+                if row.shape != (N_BINS,) or (row < 0).any():
+                    logging.error(f"[ERROR][STATS] Histogram của '{name}' trong {path} không hợp lệ "
+                                  f"(shape {row.shape}, cần ({N_BINS},)) -> bỏ qua tham chiếu.")
+                    return None
+                hist[i] = row
+            logging.info(f"[INFO][STATS] Đã tải phân phối tham chiếu từ {path}.")
+            return hist
+        except Exception as e:
+            logging.error(f"[ERROR][STATS] Không đọc được file tham chiếu {path}: {e} -> bỏ qua tham chiếu.")
+            return None
+
+    def export_reference(self, path):
+        """
+        Lưu histogram tổng hiện tại ra file JSON để dùng làm tham chiếu sau này.
+        """
+        with self._lock:
+            hist = {name: self._total.hist[i].tolist() for i, name in enumerate(self.feature_list)}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"bins_per_decade": BINS_PER_DECADE, "n_bins": N_BINS, "hist": hist}, f)
+
+    def drift(self, window="current"):
+        """
+        Population Stability Index (PSI) từng đặc trưng giữa cửa sổ (cùng quy ước `window`
+        như `snapshot`) và phân phối tham chiếu.
+        Thông thường: < 0.1 ổn định, 0.1-0.25 thay đổi nhẹ, > 0.25 drift đáng kể.
+
+        Returns:
+            dict | None: {feature: psi} (psi là None nếu cửa sổ chưa có dữ liệu
+                hoặc đặc trưng không có trong tham chiếu),
+                hoặc None nếu chưa đặt tham chiếu.
+        """
+        if self._reference is None:
+            return None
+        with self._lock:
+            self._rotate(time.time())
+            if window == "current":
+                hist = self._current.hist.copy()
+            elif window == "total":
+                hist = self._total.hist.copy()
+            else:
+                k = int(window)
+                if k <= 0:
+                    raise ValueError("[STATS] Số cửa sổ phải > 0")
+                windows = list(self._windows)[-k:]
+                hist = sum((acc.hist for acc in windows), np.zeros((self._n, N_BINS), dtype=np.int64))
+        if hist.sum() == 0:
+            return {name: None for name in self.feature_list}
+        eps = 1e-6
+        p = hist / np.maximum(hist.sum(axis=1, keepdims=True), 1) + eps
+        q = self._reference / np.maximum(self._reference.sum(axis=1, keepdims=True), 1) + eps
+        psi = ((p - q) * np.log(p / q)).sum(axis=1)
+        # Đặc trưng không có trong tham chiếu thì không đo được drift
+        has_reference = self._reference.sum(axis=1) > 0
+        return {
+            name: float(psi[i]) if has_reference[i] else None
+            for i, name in enumerate(self.feature_list)
+        }
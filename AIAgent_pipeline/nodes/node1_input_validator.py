@@ -4,14 +4,26 @@ from dotenv import load_dotenv
 import os
 import logging
 from AIAgent_pipeline.base_node import Node
+from AIAgent_pipeline.feature_stats import FeatureStats
 load_dotenv()  # Load biến môi trường từ file .env
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 class InputValidatorNode(Node):
-    def __init__(self, env_path=".env",feature_list=None):
+    def __init__(self, env_path=".env",feature_list=None, collect_stats=True):
         load_dotenv(env_path)
         self.feature_list = feature_list if feature_list is not None else [f.strip() for f in os.getenv("FEATURE_LIST", "").split(",") if f.strip()]
         if not self.feature_list:
             raise ValueError("[NODE1]Không tìm thấy FEATURE_LIST")
+        # Thống kê luồng cho từng đặc trưng (tỉ lệ clip/NaN/thiếu cột, phân phối, drift)
+        self.stats = None
+        if collect_stats:
+            self.stats = FeatureStats(
+                self.feature_list,
+                window_seconds=float(os.getenv("FEATURE_STATS_WINDOW_S", "60")),
+                max_windows=int(os.getenv("FEATURE_STATS_MAX_WINDOWS", "12")),
+            )
+            reference = os.getenv("FEATURE_STATS_REFERENCE")
+            if reference:
+                self.stats.set_reference(reference)
 
     def process(self, input_data):
         """
@@ -24,6 +36,7 @@ class InputValidatorNode(Node):
         - Đưa toàn bộ giá trị âm về 0.
         - Thêm các cột bị thiếu (nếu có) với giá trị mặc định là 0.
         - Kiểm tra xem dữ liệu sau xử lý có trống không.
+        - Cập nhật `self.stats` (nếu bật) với số ô NaN/inf/âm/thiếu và dữ liệu đã làm sạch.
 
         Args:
             input_data (pd.DataFrame | str | dict): 
@@ -51,6 +64,9 @@ class InputValidatorNode(Node):
                 raise TypeError(f"[NODE1]Dữ liệu không hợp lệ: {type(input_data)}")
             df = df[[c for c in self.feature_list if c in df.columns]]
             df = df.apply(pd.to_numeric, errors="coerce")
+            if self.stats is not None:
+                # Đếm trước khi làm sạch (các bước inplace bên dưới có thể ghi đè mảng thô)
+                replaced = self._count_replaced(df)
             df.replace([np.inf, -np.inf], np.nan, inplace=True)
             df.fillna(0, inplace=True)
             df[df < 0] = 0
@@ -62,11 +78,43 @@ class InputValidatorNode(Node):
             df = df[self.feature_list]
             if df.empty:
                 raise ValueError("[NODE1]Dữ liệu sau khi lọc bị trống!")
+            if self.stats is not None:
+                self._update_stats(replaced, df)
             logging.info(f"[INFO][NODE1]CICFlowMeter data hợp lệ. {len(df)} dòng, {len(df.columns)} cột.")
             return df
         except Exception as e:
             logging.error(f"[ERROR][NODE1]Lỗi trong InputValidatorNode: {e}",exc_info=True)
             raise 
+    def _count_replaced(self, df):
+        """
+        Đếm số ô NaN, ±inf và âm (sẽ bị thay bằng 0) theo từng cột có mặt.
+        """
+        raw = df.to_numpy(dtype=float)
+        return (
+            df.columns,
+            np.isnan(raw).sum(axis=0),
+            np.isinf(raw).sum(axis=0),
+            (raw < 0).sum(axis=0) - (raw == -np.inf).sum(axis=0),
+        )
+
+    def _update_stats(self, replaced, df):
+        """
+        Cập nhật thống kê với dữ liệu đã làm sạch và số ô bị thay thế.
+        Cột không có trong đầu vào được tính là thiếu cho toàn bộ dòng.
+        """
+        present, nan_count, inf_count, clip_count = replaced
+        n_features = len(self.feature_list)
+        nan = np.zeros(n_features, dtype=np.int64)
+        inf = np.zeros(n_features, dtype=np.int64)
+        clipped = np.zeros(n_features, dtype=np.int64)
+        missing = np.full(n_features, len(df), dtype=np.int64)
+        idx = df.columns.get_indexer(present)
+        nan[idx] = nan_count
+        inf[idx] = inf_count
+        clipped[idx] = clip_count
+        missing[idx] = 0
+        self.stats.update(df.to_numpy(dtype=float), nan=nan, inf=inf, clipped=clipped, missing=missing)
+
     def validate_features(self, df):
         """
         Kiểm tra xem DataFrame có chứa đầy đủ các đặc trưng (`features`) cần thiết không.
@@ -1,19 +1,30 @@
 import asyncio
 from dotenv import load_dotenv
 from AIAgent_pipeline import WorkflowManager, InputValidatorNode, BinaryClassifierNode, MultiClassifierNode, MODEL_MAP
+from AIAgent_pipeline.admission import DeadlineExceeded, remaining
 import pandas as pd
 import numpy as np
 import os
+import time
 import logging
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 FEATURE_LIST = [f.strip() for f in os.getenv("FEATURE_LIST", "").split(",") if f.strip()]
+MAX_CONCURRENT_ROWS = int(os.getenv("MAX_CONCURRENT_ROWS", "8"))
+# Tên giai đoạn hiển thị trong profile trace của từng request
+PHASE_NAMES = {
+    "InputValidator": "validation",
+    "BinaryClassifier": "binary_inference",
+    "MultiClassifier": "multiclass_inference",
+}
 
 class AsyncNetworkPredictor:
-    def __init__(self, mode="predict", model_path_binary=MODEL_MAP["binary_rf"], model_path_multi=MODEL_MAP["multi_rf"]):
+    def __init__(self, mode="predict", model_path_binary=MODEL_MAP["binary_rf"], model_path_multi=MODEL_MAP["multi_rf"], max_concurrency=MAX_CONCURRENT_ROWS):
         self.mode = mode
         self.model_path_binary = model_path_binary
         self.model_path_multi = model_path_multi
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
         self.wf = self._create_workflow()
     def _create_workflow(self):
         wf = WorkflowManager()
@@ -29,16 +40,72 @@ class AsyncNetworkPredictor:
         wf.connect_nodes("MultiClassifier", "END")
         return wf
 
-    async def predict(self, df: pd.DataFrame):
-        tasks = [self._process_row(row) for _, row in df.iterrows()]
-        results_list = await asyncio.gather(*tasks)
+    @property
+    def feature_stats(self):
+        """
+        Thống kê luồng của InputValidatorNode trong workflow (None nếu bị tắt).
+        """
+        return self.wf.nodes["InputValidator"].stats
+
+    async def predict(self, df: pd.DataFrame, deadline=None, trace=None, inflight=None):
+        """
+        Dự đoán cho toàn bộ DataFrame, mỗi dòng chạy workflow riêng.
+
+        Args:
+            df (pd.DataFrame): Dữ liệu đầu vào.
+            deadline (float, optional): Hạn chót theo `time.monotonic()`. Các dòng chưa
+                bắt đầu khi đã quá hạn sẽ bị bỏ, và request ném `DeadlineExceeded`.
+            trace (RequestTrace, optional): Ghi thời gian chờ hàng đợi và từng node.
+            inflight (InflightTicket, optional): Nhận các future thread đang chạy để
+                admission control chỉ trả ngân sách khi chúng thực sự xong.
+
+        Returns:
+            tuple: (labels, probs)
+        """
+        # Semaphore phải được tạo trong event loop đang chạy
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [asyncio.ensure_future(self._process_row(row, deadline, trace, inflight)) for _, row in df.iterrows()]
+        try:
+            results_list = await asyncio.wait_for(asyncio.gather(*tasks), timeout=remaining(deadline))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Quá hạn xử lý {len(df)} dòng")
+        except BaseException:
+            # Huỷ các dòng còn đang chờ để không tốn tài nguyên cho client đã bỏ cuộc.
+            # Dòng đã chạy trên thread không dừng được: thread vẫn giữ slot tới khi xong.
+            for t in tasks:
+                t.cancel()
+            raise
         
         # Gom nhãn và probabilities
         labels = [r["label"][0] for r in results_list]
         probs = [r.get("probabilities", None) for r in results_list]
         return labels, probs
 
-    async def _process_row(self, row):
-        # Chỉ chạy workflow với data row hiện tại
-        result = await asyncio.to_thread(self.wf.run, pd.DataFrame([row]))
-        return result
\ No newline at end of file
+    async def _process_row(self, row, deadline=None, trace=None, inflight=None):
+        # Giới hạn số dòng chạy đồng thời trên thread pool
+        queued_at = time.perf_counter()
+        await self._semaphore.acquire()
+        try:
+            if trace is not None:
+                trace.add("queue_wait", time.perf_counter() - queued_at)
+            left = remaining(deadline)
+            if left is not None and left <= 0:
+                raise DeadlineExceeded("Quá hạn trước khi xử lý dòng")
+            # Chỉ chạy workflow với data row hiện tại
+            future = asyncio.ensure_future(asyncio.to_thread(self.wf.run, pd.DataFrame([row]), trace))
+        except BaseException:
+            self._semaphore.release()
+            raise
+        # Slot chỉ được trả khi thread xong, kể cả khi request bị huỷ/hết hạn giữa chừng
+        future.add_done_callback(self._release_slot)
+        if inflight is not None:
+            inflight.track(future)
+        return await asyncio.shield(future)
+
+    def _release_slot(self, future):
+        self._semaphore.release()
+        # Đọc lỗi của dòng đã bị bỏ (request hết hạn) để asyncio không cảnh báo
+        # "exception was never retrieved"; request còn chờ vẫn nhận lỗi qua shield.
+        if not future.cancelled():
+            future.exception()
@@ -0,0 +1,130 @@
+import sys
+import time
+import threading
+import logging
+from collections import Counter, defaultdict
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+MAX_PROFILE_SECONDS = 60
+
+
+class SamplingProfiler:
+    def __init__(self, max_seconds=MAX_PROFILE_SECONDS):
+        """
+        Profiler lấy mẫu stack của tất cả thread trong process (không cần thư viện ngoài).
+        Kết quả ở định dạng "folded stacks" (`frame1;frame2;frame3 count`),
+        dùng trực tiếp được với flamegraph.pl, speedscope, inferno...
+
+        Args:
+            max_seconds (int): Thời gian profile tối đa cho một lần chạy.
+        """
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(self._frame_label(frame))
+            frame = frame.f_back
+        stack.reverse()
+        return ";".join(stack)
+
+    def run(self, seconds, interval_ms=5):
+        """
+        Lấy mẫu trong `seconds` giây, mỗi `interval_ms` ms một lần.
+        Chỉ cho phép một phiên profile tại một thời điểm.
+
+        Returns:
+            str: Dữ liệu folded stacks.
+
+        Raises:
+            RuntimeError: Nếu đang có phiên profile khác chạy.
+            ValueError: Nếu tham số không hợp lệ.
+        """
+        if seconds <= 0 or seconds > self.max_seconds:
+            raise ValueError(f"[PROFILER] seconds phải trong khoảng (0, {self.max_seconds}]")
+        if interval_ms <= 0:
+            raise ValueError("[PROFILER] interval_ms phải > 0")
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("[PROFILER] Đang có phiên profile khác chạy")
+        try:
+            logging.info(f"[INFO][PROFILER] Bắt đầu profile {seconds}s (mỗi {interval_ms}ms).")
+            samples = Counter()
+            me = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            interval = interval_ms / 1000
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    thread_name = names.get(ident)
+                    if thread_name is None:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                        thread_name = names.get(ident, str(ident))
+                    samples[f"{thread_name};{self._stack(frame)}"] += 1
+                time.sleep(interval)
+            logging.info(f"[INFO][PROFILER] Hoàn tất profile: {sum(samples.values())} mẫu.")
+            return "\n".join(f"{stack} {count}" for stack, count in samples.most_common())
+        finally:
+            self._lock.release()
+
+
+class RequestTrace:
+    def __init__(self, name, phase_names=None):
+        """
+        Ghi thời gian từng giai đoạn của một request (cộng dồn qua tất cả các dòng).
+        Thread-safe vì các dòng được xử lý song song trên thread pool.
+
+        Args:
+            name (str): Tên gốc của trace (ví dụ tên endpoint).
+            phase_names (dict, optional): Đổi tên node -> tên giai đoạn hiển thị.
+        """
+        self.name = name
+        self.phase_names = phase_names or {}
+        self._durations = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        phase = self.phase_names.get(phase, phase)
+        with self._lock:
+            self._durations[phase] += seconds
+
+    def timer(self, phase):
+        """
+        Context manager đo thời gian một giai đoạn.
+        """
+        return _PhaseTimer(self, phase)
+
+    def to_dict(self):
+        """
+        Trả về thời gian từng giai đoạn (ms) và dạng folded stacks
+        (giá trị tính bằng micro giây) để vẽ flamegraph.
+        """
+        with self._lock:
+            durations = dict(self._durations)
+        folded = "\n".join(f"{self.name};{phase} {int(sec * 1e6)}" for phase, sec in durations.items())
+        return {
+            "phases_ms": {phase: round(sec * 1000, 3) for phase, sec in durations.items()},
+            "folded": folded,
+        }
+
+
+class _PhaseTimer:
+    def __init__(self, trace, phase):
+        self.trace = trace
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.phase, time.perf_counter() - self.start)
+        return False
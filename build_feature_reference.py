@@ -0,0 +1,56 @@
+"""
+Công cụ offline tạo phân phối tham chiếu (reference) cho việc đo drift đặc trưng.
+
+Chạy dữ liệu huấn luyện hoặc holdout qua InputValidatorNode (làm sạch giống hệt lúc
+serving), rồi lưu histogram của từng đặc trưng ra file JSON:
+
+    python build_feature_reference.py --csv TrafficLabelling/data_binary.csv \\
+        --output models/feature_reference.json
+
+Sau đó đặt `FEATURE_STATS_REFERENCE=models/feature_reference.json` trong `.env`
+để `/stats/drift` so sánh lưu lượng thực tế với dữ liệu huấn luyện.
+"""
+import os
+import logging
+import argparse
+import pandas as pd
+from dotenv import load_dotenv
+from AIAgent_pipeline import InputValidatorNode
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+FEATURE_LIST = [f.strip() for f in os.getenv("FEATURE_LIST", "").split(",") if f.strip()]
+
+
+def build_reference(csv_paths, output, chunksize=100_000):
+    """
+    Cập nhật thống kê của validator với toàn bộ dữ liệu trong `csv_paths` (đọc theo chunk
+    để không phải nạp cả file vào bộ nhớ) và xuất histogram tham chiếu ra `output`.
+
+    Returns:
+        int: Tổng số dòng đã xử lý.
+    """
+    validator = InputValidatorNode(feature_list=FEATURE_LIST)
+    # Không cắt cửa sổ: chỉ cần thống kê tổng
+    validator.stats.window_seconds = float("inf")
+    for path in csv_paths:
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            chunk.columns = [c.strip() for c in chunk.columns]
+            validator.process(chunk)
+    validator.stats.export_reference(output)
+    rows = validator.stats.snapshot("total")["rows"]
+    logging.info(f"[INFO][REFERENCE] Đã lưu tham chiếu {rows} dòng vào {output}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo phân phối tham chiếu cho đo drift đặc trưng.")
+    parser.add_argument("--csv", nargs="+", required=True, help="File CSV huấn luyện/holdout")
+    parser.add_argument("--output", required=True, help="Đường dẫn file JSON tham chiếu")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="Số dòng đọc mỗi lần")
+    args = parser.parse_args()
+    build_reference(args.csv, args.output, args.chunksize)
+
+
+if __name__ == "__main__":
+    main()
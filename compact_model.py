@@ -0,0 +1,377 @@
+"""
+Công cụ offline thu gọn mô hình RandomForest (binary hoặc multiclass) theo ngân sách độ trễ.
+
+Mỗi ứng viên được tạo bằng cách:
+- Giữ `n_trees` cây đầu tiên của rừng (các cây trong RandomForest là độc lập, cùng phân phối).
+- Cắt các cây tại `max_depth` (node ở độ sâu giới hạn trở thành lá, giữ phân phối lớp của node).
+- Bỏ các đặc trưng có độ quan trọng bằng 0 (không còn được dùng ở bất kỳ split nào),
+  đánh lại chỉ số đặc trưng trong cây và thu hẹp `FEATURE_LIST` tương ứng.
+
+Kết quả là một RandomForestClassifier bình thường, được BinaryClassifierNode/MultiClassifierNode
+load trực tiếp bằng joblib.
+
+Vì binary và multiclass dùng chung một InputValidatorNode (chung `FEATURE_LIST`), khi thu gọn
+cả hai mô hình hãy chạy tuần tự. `--keep-features-of` giữ lại các đặc trưng mà mô hình còn lại
+thực sự dùng để split; `--align-kept-models` ở lần chạy thứ hai ghi đè mô hình binary đã thu gọn
+để bỏ các đặc trưng chỉ mô hình multiclass gốc dùng (dự đoán không đổi), nên hai mô hình kết thúc
+với cùng một danh sách đặc trưng:
+
+    python compact_model.py --model models/RandomForest_binary.joblib --kind binary \\
+        --holdout holdout_binary.csv --output models/RandomForest_binary_compact.joblib \\
+        --keep-features-of models/RandomForest_multiclass.joblib
+    python compact_model.py --model models/RandomForest_multiclass.joblib --kind multi \\
+        --holdout holdout_multi.csv --output models/RandomForest_multiclass_compact.joblib \\
+        --keep-features-of models/RandomForest_binary_compact.joblib --align-kept-models
+
+Sau đó cập nhật `FEATURE_LIST` trong `.env` theo dòng in ra ở lần chạy cuối.
+"""
+import io
+import os
+import copy
+import time
+import json
+import logging
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.tree._tree import Tree, TREE_LEAF, TREE_UNDEFINED
+from AIAgent_pipeline import InputValidatorNode, BinaryClassifierNode, MultiClassifierNode
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+FEATURE_LIST = [f.strip() for f in os.getenv("FEATURE_LIST", "").split(",") if f.strip()]
+
+DEFAULT_TREES = [100, 50, 25, 10]
+DEFAULT_DEPTHS = [None, 20, 15, 10, 8]
+
+
+def _compact_tree(estimator, max_depth=None, feature_map=None, n_features=None):
+    """
+    Tạo bản sao của một DecisionTreeClassifier đã fit với cây được cắt tại `max_depth`
+    và (tùy chọn) chỉ số đặc trưng được đánh lại theo `feature_map` {cũ: mới}.
+    Các node không còn tới được bị loại khỏi mảng node nên bộ nhớ cũng giảm theo.
+    """
+    state = estimator.tree_.__getstate__()
+    nodes, values = state["nodes"], state["values"]
+
+    # Duyệt DFS (preorder) giống thứ tự sklearn lưu node, ghi lại node giữ lại và độ sâu
+    kept, depths = [], []
+    stack = [(0, 0)]
+    while stack:
+        idx, depth = stack.pop()
+        kept.append(idx)
+        depths.append(depth)
+        is_leaf = nodes["left_child"][idx] == TREE_LEAF
+        if not is_leaf and (max_depth is None or depth < max_depth):
+            stack.append((nodes["right_child"][idx], depth + 1))
+            stack.append((nodes["left_child"][idx], depth + 1))
+    new_index = {old: new for new, old in enumerate(kept)}
+
+    new_nodes = nodes[kept].copy()
+    new_values = np.ascontiguousarray(values[kept])
+    for i, depth in enumerate(depths):
+        truncated = max_depth is not None and depth >= max_depth
+        if new_nodes["left_child"][i] == TREE_LEAF or truncated:
+            new_nodes["left_child"][i] = TREE_LEAF
+            new_nodes["right_child"][i] = TREE_LEAF
+            new_nodes["feature"][i] = TREE_UNDEFINED
+            new_nodes["threshold"][i] = TREE_UNDEFINED
+        else:
+            new_nodes["left_child"][i] = new_index[new_nodes["left_child"][i]]
+            new_nodes["right_child"][i] = new_index[new_nodes["right_child"][i]]
+            if feature_map is not None:
+                new_nodes["feature"][i] = feature_map[new_nodes["feature"][i]]
+
+    n_features = n_features if n_features is not None else estimator.tree_.n_features
+    n_classes = np.atleast_1d(estimator.n_classes_).astype(np.intp)
+    tree = Tree(n_features, n_classes, estimator.n_outputs_)
+    tree.__setstate__({
+        "max_depth": int(max(depths)),
+        "node_count": len(kept),
+        "nodes": new_nodes,
+        "values": new_values,
+    })
+    new_estimator = copy.copy(estimator)
+    new_estimator.tree_ = tree
+    new_estimator.n_features_in_ = n_features
+    return new_estimator
+
+
+def _used_features(estimators):
+    """
+    Tập chỉ số đặc trưng còn được dùng ở ít nhất một split.
+    Tương đương với các đặc trưng có `get_feature_importances()` > 0.
+    """
+    used = set()
+    for est in estimators:
+        feature = est.tree_.feature
+        used.update(int(f) for f in feature[feature >= 0])
+    return used
+
+
+def _model_features(model, feature_list):
+    """
+    Danh sách tên đặc trưng đầu vào của mô hình (theo `feature_names_in_` nếu có).
+    """
+    if hasattr(model, "feature_names_in_"):
+        return [str(f) for f in model.feature_names_in_]
+    return list(feature_list[:model.n_features_in_])
+
+
+def _used_feature_names(model, feature_list):
+    """
+    Tên các đặc trưng mà mô hình thực sự dùng để split (độ quan trọng > 0).
+    """
+    if not hasattr(model, "estimators_") or not hasattr(model.estimators_[0], "tree_"):
+        raise TypeError("[COMPACT] Chỉ hỗ trợ mô hình rừng cây của sklearn (RandomForest/ExtraTrees).")
+    names = _model_features(model, feature_list)
+    return {names[i] for i in _used_features(model.estimators_)}
+
+
+def align_forest(model, feature_list, target_features):
+    """
+    Đánh lại chỉ số đặc trưng của `model` theo đúng `target_features` mà không đổi cây
+    (chỉ bỏ các đặc trưng không được dùng), nên dự đoán giữ nguyên.
+
+    Raises:
+        ValueError: Nếu `model` dùng đặc trưng ngoài `target_features`, thiếu đặc trưng
+                    của `target_features`, hoặc thứ tự đặc trưng không khớp.
+    """
+    used = _used_feature_names(model, feature_list)
+    if not used <= set(target_features):
+        raise ValueError(f"[COMPACT] Mô hình dùng đặc trưng ngoài danh sách đích: {sorted(used - set(target_features))}")
+    if not set(target_features) <= set(feature_list):
+        raise ValueError(f"[COMPACT] Mô hình thiếu đặc trưng đầu vào: {sorted(set(target_features) - set(feature_list))}")
+    aligned, features = compact_forest(model, feature_list, keep_features=set(target_features))
+    if features != list(target_features):
+        raise ValueError("[COMPACT] Thứ tự đặc trưng của mô hình không khớp với danh sách đích.")
+    return aligned
+
+
+def compact_forest(model, feature_list, n_trees=None, max_depth=None, drop_features=True, keep_features=None):
+    """
+    Thu gọn một RandomForest.
+
+    Args:
+        model: RandomForestClassifier đã fit.
+        feature_list (list): Tên đặc trưng đầu vào của `model`, đúng thứ tự.
+        n_trees (int, optional): Số cây giữ lại (mặc định: giữ tất cả).
+        max_depth (int, optional): Độ sâu tối đa của cây (mặc định: không cắt).
+        drop_features (bool): Bỏ các đặc trưng không còn được dùng.
+        keep_features (set, optional): Tên đặc trưng luôn giữ lại (dùng chung với mô hình khác).
+
+    Returns:
+        tuple: (mô hình đã thu gọn, danh sách đặc trưng mới)
+    """
+    if not hasattr(model, "estimators_") or not hasattr(model.estimators_[0], "tree_"):
+        raise TypeError("[COMPACT] Chỉ hỗ trợ mô hình rừng cây của sklearn (RandomForest/ExtraTrees).")
+    estimators = model.estimators_[:n_trees] if n_trees is not None else list(model.estimators_)
+    estimators = [_compact_tree(est, max_depth=max_depth) for est in estimators]
+
+    new_features = list(feature_list)
+    if drop_features:
+        used = _used_features(estimators)
+        keep_features = keep_features or set()
+        kept_idx = [i for i, f in enumerate(feature_list) if i in used or f in keep_features]
+        feature_map = {old: new for new, old in enumerate(kept_idx)}
+        new_features = [feature_list[i] for i in kept_idx]
+        estimators = [
+            _compact_tree(est, feature_map=feature_map, n_features=len(new_features))
+            for est in estimators
+        ]
+
+    compacted = copy.copy(model)
+    compacted.estimators_ = estimators
+    compacted.n_estimators = len(estimators)
+    compacted.n_features_in_ = len(new_features)
+    if hasattr(model, "feature_names_in_"):
+        compacted.feature_names_in_ = np.asarray(new_features, dtype=object)
+    return compacted, new_features
+
+
+def _model_size_bytes(model):
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.getbuffer().nbytes
+
+
+def evaluate(model, X, y, latency_rows=200):
+    """
+    Đánh giá mô hình trên tập holdout: accuracy, macro F1, độ trễ 1 dòng (giống cách
+    AsyncNetworkPredictor gọi model từng dòng), thời gian dự đoán cả batch và kích thước.
+    """
+    start = time.perf_counter()
+    predictions = np.asarray(model.predict(X)).astype(str)
+    batch_ms = (time.perf_counter() - start) * 1000
+
+    sample = X.iloc[:latency_rows]
+    timings = []
+    for i in range(len(sample)):
+        row = sample.iloc[[i]]
+        start = time.perf_counter()
+        model.predict_proba(row)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "accuracy": float(accuracy_score(y, predictions)),
+        "f1_macro": float(f1_score(y, predictions, average="macro")),
+        "row_p50_ms": float(np.percentile(timings, 50)),
+        "row_p95_ms": float(np.percentile(timings, 95)),
+        "batch_ms": batch_ms,
+        "size_mb": _model_size_bytes(model) / 1e6,
+        "nodes": int(sum(est.tree_.node_count for est in model.estimators_)),
+    }
+
+
+def select_candidate(results, baseline, max_f1_drop=0.005, latency_budget_ms=None):
+    """
+    Chọn ứng viên nhanh nhất (theo p50 độ trễ 1 dòng) trong giới hạn mất F1 cho phép
+    và ngân sách độ trễ. Trả về None nếu không có ứng viên nào đạt.
+    """
+    eligible = [
+        r for r in results
+        if baseline["f1_macro"] - r["f1_macro"] <= max_f1_drop
+        and (latency_budget_ms is None or r["row_p50_ms"] <= latency_budget_ms)
+    ]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda r: (r["row_p50_ms"], -r["f1_macro"]))
+
+
+def _load_holdout(path, label_col, feature_list):
+    df = pd.read_csv(path)
+    df.columns = [c.strip() for c in df.columns]
+    if label_col not in df.columns:
+        raise ValueError(f"[COMPACT] Không tìm thấy cột nhãn '{label_col}' trong {path}")
+    y = df[label_col].astype(str).values
+    # Làm sạch dữ liệu giống hệt lúc serving
+    X = InputValidatorNode(feature_list=feature_list).process(df.drop(columns=[label_col]))
+    return X, y
+
+
+def _parse_trees(value):
+    """
+    Đọc một giá trị `--trees`: số nguyên dương.
+    """
+    try:
+        n_trees = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"số cây không hợp lệ: {value!r} (số nguyên > 0)")
+    if n_trees <= 0:
+        raise argparse.ArgumentTypeError(f"số cây phải > 0: {n_trees}")
+    return n_trees
+
+
+def _parse_depth(value):
+    """
+    Đọc một giá trị `--depths`: số nguyên dương, hoặc `full`/`none` (không cắt cây).
+    """
+    if value.lower() in ("full", "none"):
+        return None
+    try:
+        depth = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"độ sâu không hợp lệ: {value!r} (số nguyên > 0, 'full' hoặc 'none')")
+    if depth <= 0:
+        raise argparse.ArgumentTypeError(f"độ sâu phải > 0: {depth}")
+    return depth
+
+
+def _format_row(r):
+    depth = "full" if r["max_depth"] is None else r["max_depth"]
+    return (f"{r['n_trees']:>6} {str(depth):>6} {r['n_features']:>6} {r['accuracy']:>9.4f} {r['f1_macro']:>9.4f} "
+            f"{r['row_p50_ms']:>9.3f} {r['row_p95_ms']:>9.3f} {r['batch_ms']:>10.1f} {r['size_mb']:>8.2f} {r['nodes']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thu gọn mô hình RandomForest theo ngân sách độ trễ.")
+    parser.add_argument("--model", required=True, help="Đường dẫn mô hình .joblib cần thu gọn")
+    parser.add_argument("--kind", choices=["binary", "multi"], required=True, help="Loại mô hình")
+    parser.add_argument("--holdout", required=True, help="File CSV holdout có cột nhãn")
+    parser.add_argument("--label-col", default="Label", help="Tên cột nhãn trong CSV (mặc định: Label)")
+    parser.add_argument("--output", help="Nơi lưu mô hình được chọn (bỏ qua nếu chỉ muốn xem báo cáo)")
+    parser.add_argument("--trees", type=_parse_trees, nargs="+", default=DEFAULT_TREES, help="Các số cây cần thử")
+    parser.add_argument("--depths", type=_parse_depth, nargs="+",
+                        help="Các độ sâu cần thử, 'full' = không cắt (mặc định: full 20 15 10 8)")
+    parser.add_argument("--max-f1-drop", type=float, default=0.005, help="Mức giảm macro F1 tối đa cho phép")
+    parser.add_argument("--latency-budget-ms", type=float, help="Ngân sách p50 độ trễ 1 dòng (ms)")
+    parser.add_argument("--keep-all-features", action="store_true", help="Không bỏ đặc trưng có độ quan trọng 0")
+    parser.add_argument("--keep-features-of", nargs="*", default=[],
+                        help="Giữ các đặc trưng mà những mô hình này dùng để split (dùng chung FEATURE_LIST)")
+    parser.add_argument("--align-kept-models", action="store_true",
+                        help="Ghi đè các mô hình ở --keep-features-of theo danh sách đặc trưng cuối (cần --output)")
+    parser.add_argument("--report", help="Lưu báo cáo các ứng viên ra file JSON")
+    args = parser.parse_args()
+    if args.align_kept_models and not args.output:
+        parser.error("--align-kept-models cần --output")
+
+    node_cls = BinaryClassifierNode if args.kind == "binary" else MultiClassifierNode
+    node = node_cls(model_path=args.model)
+    model = node.model
+    feature_list = _model_features(model, FEATURE_LIST)
+
+    importances = node.get_feature_importances(feature_list)
+    if importances is not None:
+        zero = [f for f, imp in importances.items() if imp == 0]
+        logging.info(f"[INFO][COMPACT] {len(zero)}/{len(feature_list)} đặc trưng có độ quan trọng 0: {zero}")
+
+    keep_features = set()
+    kept_models = {}
+    for path in args.keep_features_of:
+        kept_models[path] = joblib.load(path)
+        keep_features.update(_used_feature_names(kept_models[path], FEATURE_LIST))
+
+    X, y = _load_holdout(args.holdout, args.label_col, feature_list)
+    baseline = evaluate(model, X, y)
+    baseline.update({"n_trees": len(model.estimators_), "max_depth": None, "n_features": len(feature_list)})
+
+    depths = args.depths if args.depths else DEFAULT_DEPTHS
+    candidates = []
+    for n_trees in sorted({min(t, len(model.estimators_)) for t in args.trees}, reverse=True):
+        for max_depth in depths:
+            compacted, features = compact_forest(
+                model, feature_list, n_trees=n_trees, max_depth=max_depth,
+                drop_features=not args.keep_all_features, keep_features=keep_features,
+            )
+            result = evaluate(compacted, X[features], y)
+            result.update({"n_trees": n_trees, "max_depth": max_depth, "n_features": len(features)})
+            candidates.append((result, compacted, features))
+
+    header = (f"{'trees':>6} {'depth':>6} {'feats':>6} {'accuracy':>9} {'f1_macro':>9} "
+              f"{'p50_ms':>9} {'p95_ms':>9} {'batch_ms':>10} {'size_mb':>8} {'nodes':>9}")
+    print(header)
+    print(_format_row(baseline) + "  (gốc)")
+    for result, _, _ in candidates:
+        print(_format_row(result))
+
+    results = [r for r, _, _ in candidates]
+    best = select_candidate(results, baseline, args.max_f1_drop, args.latency_budget_ms)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"baseline": baseline, "candidates": results, "selected": best}, f, indent=2)
+
+    if best is None:
+        print("Không có ứng viên nào đạt yêu cầu F1/độ trễ.")
+        return
+    result, compacted, features = next(c for c in candidates if c[0] is best)
+    print(f"\nChọn: {result['n_trees']} cây, depth={result['max_depth']}, {result['n_features']} đặc trưng, "
+          f"F1 {baseline['f1_macro']:.4f} -> {result['f1_macro']:.4f}, "
+          f"p50 {baseline['row_p50_ms']:.3f}ms -> {result['row_p50_ms']:.3f}ms "
+          f"({baseline['row_p50_ms'] / result['row_p50_ms']:.1f}x), "
+          f"{baseline['size_mb']:.2f}MB -> {result['size_mb']:.2f}MB")
+    print("FEATURE_LIST=" + ",".join(features))
+    if args.output:
+        joblib.dump(compacted, args.output)
+        logging.info(f"[INFO][COMPACT] Đã lưu mô hình thu gọn vào {args.output}")
+    if args.align_kept_models:
+        for path, other in kept_models.items():
+            aligned = align_forest(other, _model_features(other, FEATURE_LIST), features)
+            joblib.dump(aligned, path)
+            logging.info(f"[INFO][COMPACT] Đã căn {path} theo {len(features)} đặc trưng.")
+
+
+if __name__ == "__main__":
+    main()
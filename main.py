@@ -1,13 +1,29 @@
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, Request, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 import pandas as pd
-from AIAgent_pipeline import AsyncNetworkPredictor
+from AIAgent_pipeline import AsyncNetworkPredictor, AdmissionController, AdmissionRejected, DeadlineExceeded, make_deadline, SamplingProfiler, RequestTrace, PHASE_NAMES
+import asyncio
+import secrets
+import math
 import json
+import os
 
 # Khởi tạo 2 predictor lúc app start
 predictor_labels = AsyncNetworkPredictor(mode="predict")
 predictor_proba = AsyncNetworkPredictor(mode="proba")
 
+# Ngân sách số dòng đang xử lý cho từng endpoint + hạn chót mặc định của request
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", "10"))
+RETRY_AFTER_S = int(os.getenv("RETRY_AFTER_S", "1"))
+admission_labels = AdmissionController("predict_labels", int(os.getenv("MAX_INFLIGHT_ROWS_LABELS", "5000")), retry_after=RETRY_AFTER_S)
+admission_proba = AdmissionController("predict_proba", int(os.getenv("MAX_INFLIGHT_ROWS_PROBA", "5000")), retry_after=RETRY_AFTER_S)
+
+# Profiling cho admin (tắt nếu không đặt ADMIN_TOKEN)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+profiler = SamplingProfiler()
+
 # FastAPI app
 app = FastAPI(title="Intrusion Detection API")
 
@@ -29,8 +45,77 @@ async def _prepare_dataframe(file, input_data):
         return None, "Không có dữ liệu đầu vào"
     return df, None
 
+def _request_deadline(timeout_header):
+    """
+    Tính hạn chót cho request: lấy `X-Request-Timeout` (giây) của client nếu có,
+    nhưng không vượt quá `REQUEST_TIMEOUT_S` của server. Giá trị không hợp lệ
+    (không phải số, <= 0, NaN, inf) bị bỏ qua để client không thể tắt hạn chót.
+    """
+    timeout = REQUEST_TIMEOUT_S
+    if timeout_header:
+        try:
+            client_timeout = float(timeout_header)
+        except ValueError:
+            client_timeout = None
+        if client_timeout is not None and math.isfinite(client_timeout) and client_timeout > 0:
+            timeout = min(REQUEST_TIMEOUT_S, client_timeout)
+    return make_deadline(timeout)
+
+def _check_admin(admin_token):
+    """
+    Kiểm tra header `X-Admin-Token`. Trả về JSONResponse lỗi hoặc None nếu hợp lệ.
+    """
+    if not ADMIN_TOKEN:
+        return JSONResponse(status_code=403, content={"error": "Chức năng admin đã bị tắt (chưa đặt ADMIN_TOKEN)"})
+    if not admin_token or not secrets.compare_digest(admin_token, ADMIN_TOKEN):
+        return JSONResponse(status_code=401, content={"error": "Admin token không hợp lệ"})
+    return None
+
+def _request_trace(name, x_profile, admin_token):
+    """
+    Tạo RequestTrace nếu client gửi `X-Profile: 1` kèm admin token hợp lệ.
+    """
+    if x_profile != "1" or _check_admin(admin_token) is not None:
+        return None
+    return RequestTrace(name, phase_names=PHASE_NAMES)
+
+def _respond(content, trace):
+    """
+    Trả kết quả; nếu đang trace thì đo thời gian serialize chính body được gửi đi,
+    sau đó nối thêm trường `profile` vào cuối JSON (không encode lại kết quả).
+    """
+    if trace is None:
+        return content
+    with trace.timer("serialization"):
+        response = JSONResponse(content=jsonable_encoder(content))
+    profile = json.dumps(trace.to_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    response.body = response.body[:-1] + b',"profile":' + profile + b"}"
+    response.init_headers()  # cập nhật lại Content-Length
+    return response
+
+async def _run_admitted(request, admission, predictor, df, deadline, trace=None):
+    """
+    Chạy predictor trong ngân sách của endpoint.
+    Trả về (labels, probs, None) hoặc (None, None, JSONResponse lỗi).
+    """
+    try:
+        with admission.admit(len(df)) as inflight:
+            # Client đã ngắt kết nối trong lúc upload -> không cần xử lý nữa
+            if await request.is_disconnected():
+                raise DeadlineExceeded("Client đã ngắt kết nối")
+            labels, probs = await predictor.predict(df, deadline=deadline, trace=trace, inflight=inflight)
+            return labels, probs, None
+    except AdmissionRejected as e:
+        return None, None, JSONResponse(
+            status_code=e.status_code,
+            content={"error": str(e)},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except DeadlineExceeded as e:
+        return None, None, JSONResponse(status_code=504, content={"error": f"Quá hạn xử lý request: {e}"})
+
 @app.post("/predict_labels")
-async def predict_labels_endpoint(file: UploadFile = File(None), input_data: str = Form(None)):
+async def predict_labels_endpoint(request: Request, file: UploadFile = File(None), input_data: str = Form(None), x_request_timeout: str = Header(None), x_profile: str = Header(None), x_admin_token: str = Header(None)):
     """
     ### Mục đích:
     Dự đoán nhãn mạng (Network Intrusion Detection) cho từng hàng dữ liệu đầu vào, chỉ trả nhãn (label).
@@ -46,6 +131,9 @@ async def predict_labels_endpoint(file: UploadFile = File(None), input_data: str
         ]
     }
     ```
+    - Header `X-Request-Timeout` (tùy chọn): số giây client sẵn sàng chờ.
+    - Header `X-Profile: 1` + `X-Admin-Token` (tùy chọn): trả thêm trường `profile`
+      với thời gian từng giai đoạn (validation, binary/multiclass inference, serialization).
 
     ### Trả về:
     ```json
@@ -53,16 +141,24 @@ async def predict_labels_endpoint(file: UploadFile = File(None), input_data: str
         "labels": ["BENIGN", "DOS_DDOS", ...]
     }
     ```
+
+    ### Lưu ý:
+    - Quá tải: trả `429` (hoặc `413` nếu request lớn hơn cả ngân sách) kèm header `Retry-After`.
+    - Quá hạn chót: trả `504`, các dòng chưa xử lý bị bỏ.
     """
+    deadline = _request_deadline(x_request_timeout)
+    trace = _request_trace("predict_labels", x_profile, x_admin_token)
     df, error = await _prepare_dataframe(file, input_data)
     if error:
         return {"error": error}
 
-    labels, _ = await predictor_labels.predict(df)
-    return {"labels": labels}
+    labels, _, error_response = await _run_admitted(request, admission_labels, predictor_labels, df, deadline, trace)
+    if error_response:
+        return error_response
+    return _respond({"labels": labels}, trace)
 
 @app.post("/predict_proba")
-async def predict_proba_endpoint(file: UploadFile = File(None), input_data: str = Form(None)):
+async def predict_proba_endpoint(request: Request, file: UploadFile = File(None), input_data: str = Form(None), x_request_timeout: str = Header(None), x_profile: str = Header(None), x_admin_token: str = Header(None)):
     """
     ### Mục đích:
     Dự đoán nhãn mạng và xác suất nhãn cao nhất (max probability) cho từng hàng dữ liệu đầu vào.
@@ -95,13 +191,148 @@ async def predict_proba_endpoint(file: UploadFile = File(None), input_data: str
     ### Lưu ý:
     - Nếu xác suất không có (`None`), giá trị trong `probabilities` sẽ là `null`.
     - Predictor được khởi tạo một lần, **không tạo lại workflow mỗi lần gọi**, giúp tối ưu hiệu năng.
+    - Quá tải: trả `429` (hoặc `413` nếu request lớn hơn cả ngân sách) kèm header `Retry-After`.
+    - Quá hạn chót (`X-Request-Timeout` hoặc `REQUEST_TIMEOUT_S`): trả `504`.
+    - `X-Profile: 1` + `X-Admin-Token`: trả thêm trường `profile` (xem `/predict_labels`).
     """
+    deadline = _request_deadline(x_request_timeout)
+    trace = _request_trace("predict_proba", x_profile, x_admin_token)
     df, error = await _prepare_dataframe(file, input_data)
     if error:
         return {"error": error}
 
-    labels, probs = await predictor_proba.predict(df)
+    labels, probs, error_response = await _run_admitted(request, admission_proba, predictor_proba, df, deadline, trace)
+    if error_response:
+        return error_response
     # Chỉ lấy xác suất max cho mỗi hàng
     probs_list = [float(p[0]) if p and len(p) > 0 else None for p in probs]
 
-    return {"labels": labels, "probabilities": probs_list}
+    return _respond({"labels": labels, "probabilities": probs_list}, trace)
+
+@app.get("/admission/stats")
+async def admission_stats_endpoint():
+    """
+    ### Mục đích:
+    Xem bộ đếm admission control của từng endpoint dự đoán.
+
+    ### Trả về:
+    ```json
+    {
+        "predict_labels": {"max_inflight_rows": 5000, "inflight_rows": 0, "admitted": 10, "shed": 2, "expired": 0, "completed": 10},
+        "predict_proba": {...}
+    }
+    ```
+    """
+    return {
+        "predict_labels": admission_labels.stats(),
+        "predict_proba": admission_proba.stats(),
+    }
+
+@app.post("/admin/profile")
+async def admin_profile_endpoint(seconds: float = 10, interval_ms: float = 5, x_admin_token: str = Header(None)):
+    """
+    ### Mục đích:
+    Profile lấy mẫu (sampling) worker đang chạy trong `seconds` giây, không cần redeploy.
+    Chỉ dành cho admin (header `X-Admin-Token` phải khớp `ADMIN_TOKEN`).
+
+    ### Tham số:
+    - `seconds`: thời gian profile (tối đa 60 giây).
+    - `interval_ms`: chu kỳ lấy mẫu (ms).
+
+    ### Trả về:
+    Văn bản dạng folded stacks (`frame1;frame2;... count`), dùng trực tiếp với
+    `flamegraph.pl`, speedscope hoặc inferno.
+
+    ### Lưu ý:
+    - Chỉ chạy một phiên profile tại một thời điểm (phiên khác trả `409`).
+    """
+    error_response = _check_admin(x_admin_token)
+    if error_response:
+        return error_response
+    try:
+        folded = await asyncio.to_thread(profiler.run, seconds, interval_ms)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except RuntimeError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+    return PlainTextResponse(folded)
+
+def _stats_predictors(endpoint):
+    predictors = {"predict_labels": predictor_labels, "predict_proba": predictor_proba}
+    if endpoint:
+        return {endpoint: predictors[endpoint]} if endpoint in predictors else None
+    return predictors
+
+@app.get("/stats/features")
+async def feature_stats_endpoint(window: str = "current", endpoint: str = None):
+    """
+    ### Mục đích:
+    Xem thống kê luồng của từng đặc trưng do InputValidatorNode thu thập:
+    số dòng, mean/std, min/max, quantile (p50/p90/p99) và tỉ lệ NaN / inf / clip âm / thiếu cột.
+
+    ### Tham số:
+    - `window`: `"current"` (cửa sổ đang mở), `"total"` (từ lúc khởi động),
+      hoặc số nguyên `k` (gộp k cửa sổ đã đóng gần nhất, mỗi cửa sổ `FEATURE_STATS_WINDOW_S` giây).
+    - `endpoint` (tùy chọn): `predict_labels` hoặc `predict_proba`; mặc định trả cả hai.
+
+    ### Trả về:
+    ```json
+    {
+        "predict_labels": {
+            "window_start": 1760000000.0, "window_end": null, "rows": 1200,
+            "features": {"Flow Duration": {"mean": 12.3, "p99": 4500.0, "clip_rate": 0.0, ...}, ...}
+        }
+    }
+    ```
+    """
+    predictors = _stats_predictors(endpoint)
+    if predictors is None:
+        return JSONResponse(status_code=400, content={"error": f"Endpoint không hợp lệ: {endpoint}"})
+    try:
+        return {
+            name: p.feature_stats.snapshot(window) if p.feature_stats else None
+            for name, p in predictors.items()
+        }
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": f"window không hợp lệ: {e}"})
+
+@app.get("/stats/drift")
+async def feature_drift_endpoint(window: str = "current", endpoint: str = None):
+    """
+    ### Mục đích:
+    Đo drift của từng đặc trưng (PSI) giữa cửa sổ thống kê và phân phối tham chiếu
+    (`FEATURE_STATS_REFERENCE`, tạo từ dữ liệu huấn luyện bằng `build_feature_reference.py`,
+    hoặc chốt từ lưu lượng hiện tại qua `/admin/stats/reference`).
+
+    ### Trả về:
+    `{"predict_labels": {"Flow Duration": 0.03, ...}, ...}` — `null` nếu chưa có tham chiếu.
+    PSI < 0.1: ổn định, 0.1–0.25: thay đổi nhẹ, > 0.25: drift đáng kể.
+    """
+    predictors = _stats_predictors(endpoint)
+    if predictors is None:
+        return JSONResponse(status_code=400, content={"error": f"Endpoint không hợp lệ: {endpoint}"})
+    try:
+        return {
+            name: p.feature_stats.drift(window) if p.feature_stats else None
+            for name, p in predictors.items()
+        }
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": f"window không hợp lệ: {e}"})
+
+@app.post("/admin/stats/reference")
+async def feature_reference_endpoint(endpoint: str = None, x_admin_token: str = Header(None)):
+    """
+    ### Mục đích:
+    Chốt thống kê tổng hiện tại làm phân phối tham chiếu cho `/stats/drift`.
+    Chỉ dành cho admin (header `X-Admin-Token`).
+    """
+    error_response = _check_admin(x_admin_token)
+    if error_response:
+        return error_response
+    predictors = _stats_predictors(endpoint)
+    if predictors is None:
+        return JSONResponse(status_code=400, content={"error": f"Endpoint không hợp lệ: {endpoint}"})
+    for p in predictors.values():
+        if p.feature_stats:
+            p.feature_stats.set_reference()
+    return {"reference_set": list(predictors.keys())}